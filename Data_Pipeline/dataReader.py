@@ -1,107 +1,514 @@
 from abc import ABC, abstractmethod
-from typing import List, Dict, Union, Any
+from collections import OrderedDict
+from contextlib import closing
+from typing import List, Dict, Union, Any, Optional, Tuple, Iterator, Container
+from concurrent.futures import ThreadPoolExecutor
+from itertools import chain
 import csv
+import hashlib
+import io
 import json
+import os
+import re
+import sqlite3
+import time
 from pathlib import Path
+import numpy as np
+
+try:
+    import pyarrow as pa
+    import pyarrow.csv as pa_csv
+except ImportError:
+    pa = None
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import liburing
+except ImportError:
+    liburing = None
+
+# orjson silently turns integers outside the 64-bit range into floats; any
+# such literal has at least 19 digits
+_LONG_DIGITS = re.compile(rb'\d{19,}')
+
+def _json_loads(data: bytes) -> Any:
+    if orjson is None or _LONG_DIGITS.search(data):
+        return json.loads(data)
+    try:
+        return orjson.loads(data)
+    except orjson.JSONDecodeError:
+        # orjson rejects the NaN/Infinity literals that json accepts
+        return json.loads(data)
 
 class BaseReader(ABC):
+    """
+    Reads a file into normalized items: dicts tagged with their source 'file'.
+    """
+    def read(self, file_path: str) -> List[Dict[str, Any]]:
+        with open(file_path, 'rb') as file:
+            return self.parse(file.read(), file_path)
+
     @abstractmethod
-    def read(self, file_path: str) -> List[Union[str, Dict[str, Any]]]:
+    def parse(self, data: bytes, file_path: str) -> List[Dict[str, Any]]:
         pass
 
+    @staticmethod
+    def normalize(item: Union[str, Dict[str, Any]], file_path: str) -> Dict[str, Any]:
+        if isinstance(item, str):
+            return {'text': item.strip(), 'file': file_path}
+        if isinstance(item, dict):
+            item['file'] = file_path
+            return item
+        raise ValueError(f"Unexpected data type: {type(item)}")
+
 class CSVReader(BaseReader):
     def read(self, file_path: str) -> List[Dict[str, Any]]:
-        with open(file_path, 'r', newline='', encoding='utf-8') as file:
-            reader = csv.DictReader(file)
-            return list(reader)
+        if pa is not None:
+            return super().read(file_path)
+        # Without Arrow, stream rows from the file instead of buffering it
+        with open(file_path, 'r', newline='', encoding='utf-8-sig') as file:
+            return self._read_dict(file, file_path)
+
+    def parse(self, data: bytes, file_path: str) -> List[Dict[str, Any]]:
+        if pa is not None:
+            try:
+                return self._read_arrow(data, file_path)
+            except pa.ArrowInvalid:
+                # e.g. ragged rows, which csv.DictReader pads with None
+                pass
+        text = io.TextIOWrapper(io.BytesIO(data), encoding='utf-8-sig', newline='')
+        return self._read_dict(text, file_path)
+
+    def _read_dict(self, file: io.TextIOBase, file_path: str) -> List[Dict[str, Any]]:
+        # utf-8-sig drops a leading BOM like Arrow does, so header keys do not
+        # depend on which parser ran
+        rows = []
+        for row in csv.DictReader(file):
+            row['file'] = file_path
+            rows.append(row)
+        return rows
+
+    def _read_arrow(self, buffer: bytes, file_path: str) -> List[Dict[str, Any]]:
+        # Arrow strips a leading BOM from the header, so decode it the same way
+        # for the column names to line up
+        text = io.TextIOWrapper(io.BytesIO(buffer), encoding='utf-8-sig', newline='')
+        header = next(csv.reader(text), None)
+        if not header:
+            return []
+
+        # Parse with Arrow's multithreaded C++ reader, keeping every column
+        # as a string to match csv.DictReader
+        table = pa_csv.read_csv(
+            pa.BufferReader(buffer),
+            read_options=pa_csv.ReadOptions(block_size=8 << 20),
+            parse_options=pa_csv.ParseOptions(newlines_in_values=True),
+            convert_options=pa_csv.ConvertOptions(
+                column_types={name: pa.string() for name in header},
+                strings_can_be_null=False
+            )
+        )
+        # Tag rows with their source as a column so no per-row pass is needed
+        if 'file' in table.column_names:
+            table = table.remove_column(table.column_names.index('file'))
+        table = table.append_column('file', pa.array([file_path] * table.num_rows, pa.string()))
+        return table.to_pylist()
 
 class JSONReader(BaseReader):
-    def read(self, file_path: str) -> List[Dict[str, Any]]:
-        with open(file_path, 'r', encoding='utf-8') as file:
-            data = json.load(file)
-            return data if isinstance(data, list) else [data]
+    def parse(self, data: bytes, file_path: str) -> List[Dict[str, Any]]:
+        data = _json_loads(data)
+        if not isinstance(data, list):
+            data = [data]
+        return [self.normalize(item, file_path) for item in data]
+
+class JSONLinesReader(BaseReader):
+    def parse(self, data: bytes, file_path: str) -> List[Dict[str, Any]]:
+        return [self.normalize(_json_loads(line), file_path) for line in data.split(b'\n') if line.strip()]
 
 class TextReader(BaseReader):
-    def read(self, file_path: str) -> List[str]:
-        with open(file_path, 'r', encoding='utf-8') as file:
-            return file.readlines()
-        
+    def parse(self, data: bytes, file_path: str) -> List[Dict[str, Any]]:
+        # Map \r and \r\n to \n as text mode would, then split in C.
+        # str.splitlines would also break on form feeds and other separators
+        # that readlines keeps
+        text = data.decode('utf-8').replace('\r\n', '\n').replace('\r', '\n')
+        lines = text.split('\n')
+        if lines[-1] == '':
+            lines.pop()
+        return [{'text': line.strip(), 'file': file_path} for line in lines]
+
+class _UringReader:
+    """
+    Reads whole files through io_uring, submitting a batch of reads at once
+    instead of issuing one read syscall per file.
+    """
+    def __init__(self, queue_depth: int = 256):
+        self.queue_depth = queue_depth
+        self.ring = liburing.Ring()
+        self.cqe = liburing.Cqe()
+        # Raises OSError when the kernel or a seccomp filter disallows io_uring
+        liburing.io_uring_queue_init(queue_depth, self.ring)
+
+    def __enter__(self) -> '_UringReader':
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        liburing.io_uring_queue_exit(self.ring)
+
+    def read_batches(self, paths: List[str]) -> Iterator[Tuple[List[str], List[bytes]]]:
+        for start in range(0, len(paths), self.queue_depth):
+            batch = paths[start:start + self.queue_depth]
+            yield batch, self._read_batch(batch)
+
+    def _read_batch(self, paths: List[str]) -> List[bytes]:
+        fds = []
+        try:
+            buffers = []
+            for path in paths:
+                fds.append(os.open(path, os.O_RDONLY))
+                buffers.append(bytearray(os.fstat(fds[-1]).st_size))
+
+            pending = 0
+            for index, (fd, buffer) in enumerate(zip(fds, buffers)):
+                if buffer:
+                    sqe = liburing.io_uring_get_sqe(self.ring)
+                    liburing.io_uring_prep_read(sqe, fd, buffer, 0)
+                    liburing.io_uring_sqe_set_data64(sqe, index)
+                    pending += 1
+            if pending:
+                liburing.io_uring_submit(self.ring)
+
+            results = [0] * len(paths)
+            while pending:
+                liburing.io_uring_wait_cqe(self.ring, self.cqe)
+                ready = liburing.io_uring_cq_ready(self.ring)
+                for i in range(ready):
+                    results[liburing.io_uring_cqe_get_data64(self.cqe[i])] = self.cqe[i].res
+                liburing.io_uring_cq_advance(self.ring, ready)
+                pending -= ready
+
+            data = []
+            for fd, buffer, result in zip(fds, buffers, results):
+                length = liburing.trap_error(result)  # Raises OSError for a failed read
+                # Finish short reads (e.g. files over the 2 GiB per-read limit)
+                while length < len(buffer):
+                    chunk = os.pread(fd, len(buffer) - length, length)
+                    if not chunk:
+                        break
+                    buffer[length:length + len(chunk)] = chunk
+                    length += len(chunk)
+                data.append(bytes(buffer[:length]))
+            return data
+        finally:
+            for fd in fds:
+                os.close(fd)
+
+
+def _walk_files(root: str, suffixes: Container[str]) -> Iterator[str]:
+    # os.scandir reuses the directory entries' cached type info, so no
+    # Path objects or extra stat calls are made for non-matching entries.
+    # Like Path.rglob, unreadable subdirectories are skipped; unlike it, a
+    # missing or unreadable root raises so a wrong data_dir is not mistaken
+    # for an empty corpus
+    stack = [root]
+    while stack:
+        path = stack.pop()
+        try:
+            entries = os.scandir(path)
+        except PermissionError:
+            if path is root:
+                raise
+            continue
+        with entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(entry.path)
+                elif os.path.splitext(entry.name)[1] in suffixes:
+                    yield entry.path
 
 class UnifiedReader:
-    def __init__(self):
+    def __init__(self, use_uring: bool = True):
+        # io_uring is only used when liburing is installed and the kernel allows it
+        self.use_uring = use_uring and liburing is not None
         self.readers = {
             '.csv': CSVReader(),
             '.json': JSONReader(),
+            '.jsonl': JSONLinesReader(),
+            '.ndjson': JSONLinesReader(),
             '.txt': TextReader()
         }
 
-    def read_file(self, file_path: str) -> List[Dict[str, Any]]:
+    def _reader_for(self, file_path: str) -> BaseReader:
         ext = Path(file_path).suffix
         if ext not in self.readers:
             raise ValueError(f"Unsupported file type: {ext}")
-        
-        raw_data = self.readers[ext].read(file_path)
-        
-        # Normalize the data structure
-        normalized_data = []
-        for item in raw_data:
-            if isinstance(item, str):
-                normalized_data.append({'text': item.strip(), 'file': file_path})
-            elif isinstance(item, dict):
-                item['file'] = file_path
-                normalized_data.append(item)
+        return self.readers[ext]
+
+    def read_file(self, file_path: str) -> List[Dict[str, Any]]:
+        return self._reader_for(file_path).read(file_path)
+
+    def parse_file(self, file_path: str, data: bytes) -> List[Dict[str, Any]]:
+        return self._reader_for(file_path).parse(data, file_path)
+
+    def _open_uring(self) -> Optional[_UringReader]:
+        if not self.use_uring:
+            return None
+        try:
+            return _UringReader()
+        except OSError:
+            return None
+
+    def list_files(self, dir_path: str) -> List[str]:
+        return list(_walk_files(dir_path, self.readers))
+
+    def read_directory(self, dir_path: str, max_workers: Optional[int] = None) -> List[Dict[str, Any]]:
+        paths = self.list_files(dir_path)
+        if not paths:
+            return []
+
+        if max_workers is None:
+            max_workers = min(32, (os.cpu_count() or 1) * 4)
+        uring = self._open_uring()
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(paths))) as executor:
+            if uring is None:
+                # File reads are IO-bound, so threads overlap them despite the GIL
+                results = list(executor.map(self.read_file, paths))
             else:
-                raise ValueError(f"Unexpected data type: {type(item)}")
-        
-        return normalized_data
-
-    def read_directory(self, dir_path: str) -> List[Dict[str, Any]]:
-        all_data = []
-        for file_path in Path(dir_path).rglob('*'):
-            if file_path.suffix in self.readers:
-                all_data.extend(self.read_file(str(file_path)))
-        return all_data
+                # Each batch of files is read with a single io_uring submission,
+                # then parsed on the thread pool
+                results = []
+                with uring:
+                    for batch, buffers in uring.read_batches(paths):
+                        results.extend(executor.map(self.parse_file, batch, buffers))
+        return list(chain.from_iterable(results))
     
 from transformers import AutoTokenizer
 
+# Let the Rust tokenizer backend use its thread pool for batch encoding
+os.environ.setdefault('TOKENIZERS_PARALLELISM', 'true')
+
 class LLMDataPreparer:
-    def __init__(self, model_name: str, max_length: int = 512):
-        self.tokenizer = AutoTokenizer.from_pretrained(model_name)
+    """
+    Tokenizes normalized items for LLM training.
+
+    Requires a fast (Rust-backed) tokenizer; falling back to the slow
+    Python implementation would make tokenization the dominant cost.
+
+    With chunk_cache_size > 0, texts are tokenized line by line and each
+    line's tokens are kept in an LRU cache, so prefixes shared between texts
+    (e.g. documents prepended to different queries) are tokenized once.
+    This assumes newlines are token boundaries and that special tokens are
+    added the same way as for whole texts, as for WordPiece models; other
+    tokenizers are rejected when the preparer is created.
+
+    With cache_dir set, each text's unpadded token ids are stored in a
+    SQLite database keyed by a hash of the text and tokenizer settings, so
+    texts seen in earlier runs skip tokenization. Least recently used
+    entries are evicted once the stored ids exceed cache_max_bytes.
+    """
+    # Slots avoid an instance __dict__ lookup on the hot tokenizer attributes
+    __slots__ = ('tokenizer', 'model_name', 'max_length', 'chunk_cache_size', '_chunk_cache',
+                 'cache_path', 'cache_max_bytes')
+
+    def __init__(self, model_name: str, max_length: int = 512, cache_dir: Optional[str] = None,
+                 chunk_cache_size: int = 0, cache_max_bytes: int = 1 << 30):
+        self.tokenizer = AutoTokenizer.from_pretrained(model_name, use_fast=True)
+        if not self.tokenizer.is_fast:
+            raise ValueError(f"No fast tokenizer available for model: {model_name}")
+        self.model_name = model_name
         self.max_length = max_length
+        self.chunk_cache_size = chunk_cache_size
+        self._chunk_cache: 'OrderedDict[str, List[int]]' = OrderedDict()
+        self.cache_max_bytes = cache_max_bytes
+        self.cache_path = None
+        if cache_dir is not None:
+            Path(cache_dir).mkdir(parents=True, exist_ok=True)
+            self.cache_path = str(Path(cache_dir) / 'tokens.sqlite')
+            with closing(self._connect()) as db, db:
+                db.execute("PRAGMA journal_mode=WAL")
+                db.execute(
+                    "CREATE TABLE IF NOT EXISTS tokens "
+                    "(key BLOB PRIMARY KEY, ids BLOB NOT NULL, last_used INTEGER NOT NULL) WITHOUT ROWID"
+                )
+                db.execute("CREATE INDEX IF NOT EXISTS tokens_last_used ON tokens (last_used)")
+        if chunk_cache_size:
+            self._check_chunking()
+
+    def _check_chunking(self) -> None:
+        # Line-by-line encoding must give the same ids as encoding whole texts,
+        # including the special tokens prepare_for_model adds
+        probe = ['Hello world.\nSecond line,\n\n  indented.\r\nLast', 'x', '']
+        chunked = self._tokenize_chunked(probe)
+        self._chunk_cache.clear()
+        if chunked != self._tokenize(probe):
+            raise ValueError(
+                f"Tokenizer for model {self.model_name} does not encode text line by line "
+                "the same way as whole texts; use chunk_cache_size=0"
+            )
+
+    def _connect(self) -> sqlite3.Connection:
+        # SQLite serializes writers, so several processes can share the cache
+        return sqlite3.connect(self.cache_path, timeout=60)
+
+    def _cache_key(self, text: str) -> bytes:
+        key = f"{self.model_name}|{self.max_length}|{bool(self.chunk_cache_size)}|{text}".encode('utf-8')
+        return hashlib.blake2b(key, digest_size=16).digest()
+
+    def _from_cache(self, blob: bytes) -> Tuple[List[int], List[int]]:
+        # Only real tokens are stored; padding is rebuilt from the tokenizer
+        ids = np.frombuffer(blob, dtype=np.int32).tolist()
+        padding = self.max_length - len(ids)
+        pad = [self.tokenizer.pad_token_id] * padding
+        if self.tokenizer.padding_side == 'left':
+            return pad + ids, [0] * padding + [1] * len(ids)
+        return ids + pad, [1] * len(ids) + [0] * padding
+
+    def _evict(self, db: sqlite3.Connection, now: int) -> None:
+        total = db.execute("SELECT COALESCE(SUM(LENGTH(ids)), 0) FROM tokens").fetchone()[0]
+        while total > self.cache_max_bytes:
+            # Entries used by the current call have last_used == now and are kept
+            rows = db.execute(
+                "SELECT key, LENGTH(ids) FROM tokens WHERE last_used < ? ORDER BY last_used LIMIT 1000", (now,)
+            ).fetchall()
+            if not rows:
+                break
+            evicted = []
+            for key, size in rows:
+                if total <= self.cache_max_bytes:
+                    break
+                evicted.append((key,))
+                total -= size
+            db.executemany("DELETE FROM tokens WHERE key = ?", evicted)
+
+    def _encode_cached(self, texts: List[str], tokenize) -> List[Tuple[List[int], List[int]]]:
+        keys = [self._cache_key(text) for text in texts]
+        now = time.time_ns()
+        with closing(self._connect()) as db, db:
+            cached = {}
+            for start in range(0, len(keys), 500):
+                batch = keys[start:start + 500]
+                placeholders = ','.join('?' * len(batch))
+                cached.update(db.execute(f"SELECT key, ids FROM tokens WHERE key IN ({placeholders})", batch))
+
+            results = [None] * len(texts)
+            missing = []
+            for i, key in enumerate(keys):
+                if key in cached:
+                    results[i] = self._from_cache(cached[key])
+                else:
+                    missing.append(i)
+
+            rows = []
+            if missing:
+                for i, (ids, mask) in zip(missing, tokenize([texts[i] for i in missing])):
+                    results[i] = (ids, mask)
+                    real_ids = np.asarray([t for t, m in zip(ids, mask) if m], dtype=np.int32)
+                    rows.append((keys[i], real_ids.tobytes(), now))
+            db.executemany("INSERT OR REPLACE INTO tokens VALUES (?, ?, ?)", rows)
+            db.executemany("UPDATE tokens SET last_used = ? WHERE key = ?", [(now, key) for key in cached])
+            self._evict(db, now)
+        return results
+
+    def _tokenize(self, texts: List[str]) -> List[Tuple[List[int], List[int]]]:
+        # A single batched call lets the fast tokenizer encode in parallel
+        encoded = self.tokenizer(
+            texts,
+            add_special_tokens=True,
+            max_length=self.max_length,
+            padding='max_length',
+            truncation=True,
+            return_attention_mask=True
+        )
+        return list(zip(encoded['input_ids'], encoded['attention_mask']))
+
+    def _tokenize_chunked(self, texts: List[str]) -> List[Tuple[List[int], List[int]]]:
+        results = []
+        # Texts are handled in slices and the cache is trimmed after each one,
+        # so it never holds more than one slice's worth of extra chunks
+        for start in range(0, len(texts), 1024):
+            chunked = [text.splitlines(keepends=True) for text in texts[start:start + 1024]]
+            missing = list(dict.fromkeys(
+                chunk for chunks in chunked for chunk in chunks if chunk not in self._chunk_cache
+            ))
+            fresh = {}
+            if missing:
+                fresh = dict(zip(missing, self.tokenizer(missing, add_special_tokens=False)['input_ids']))
+
+            for chunks in chunked:
+                ids = []
+                for chunk in chunks:
+                    if chunk in fresh:
+                        ids.extend(fresh[chunk])
+                    else:
+                        self._chunk_cache.move_to_end(chunk)
+                        ids.extend(self._chunk_cache[chunk])
+                # Adds special tokens, truncates and pads like a full call;
+                # _check_chunking verifies this for the loaded tokenizer
+                prepared = self.tokenizer.prepare_for_model(
+                    ids,
+                    add_special_tokens=True,
+                    max_length=self.max_length,
+                    padding='max_length',
+                    truncation=True,
+                    return_attention_mask=True
+                )
+                results.append((prepared['input_ids'], prepared['attention_mask']))
+
+            self._chunk_cache.update(fresh)
+            while len(self._chunk_cache) > self.chunk_cache_size:
+                self._chunk_cache.popitem(last=False)
+        return results
+
+    def _encode(self, texts: List[str]) -> List[Tuple[List[int], List[int]]]:
+        if not texts:
+            return []
+        # Tokenize each distinct text once and share the result between duplicates
+        unique = {text: i for i, text in enumerate(dict.fromkeys(texts))}
+        tokenize = self._tokenize_chunked if self.chunk_cache_size else self._tokenize
+        if self.cache_path is None:
+            encoded = tokenize(list(unique))
+        else:
+            encoded = self._encode_cached(list(unique), tokenize)
+        return [encoded[unique[text]] for text in texts]
 
     def prepare_data(self, data: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        if not data:
+            return []
+
+        # Assume 'text' is the key for the main content, adjust if needed
+        texts = [str(item.get('text', '')) for item in data]
+        encoded = self._encode(texts)
+
         prepared_data = []
-        for item in data:
-            # Assume 'text' is the key for the main content, adjust if needed
-            text = item.get('text', '')
-            if not isinstance(text, str):
-                text = str(text)  # Convert to string if it's not
-
-            encoded = self.tokenizer.encode_plus(
-                text,
-                add_special_tokens=True,
-                max_length=self.max_length,
-                padding='max_length',
-                truncation=True,
-                return_attention_mask=True
-            )
+        for item, (input_ids, attention_mask) in zip(data, encoded):
             prepared_item = {
-                'input_ids': encoded['input_ids'],
-                'attention_mask': encoded['attention_mask'],
+                'input_ids': input_ids,
+                'attention_mask': attention_mask,
                 'file': item.get('file', ''),  # Include source file information
             }
             # Include any other metadata from the original item
             prepared_item.update({k: v for k, v in item.items() if k not in prepared_item})
             prepared_data.append(prepared_item)
         return prepared_data
-    
-    def parser(self, data: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
-        prepared_data = []
-        for item in data:
-            # Assume 'text' is the key for the main content, adjust if needed
-            text = item.get('text', '')
-            if not isinstance(text, str):
-                text = str(text)
+
+    def prepare_arrays(self, data: List[Dict[str, Any]]) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Tokenizes data into packed (N, max_length) int32 input_ids and uint8 attention_mask arrays.
+        """
+        encoded = self._encode([str(item.get('text', '')) for item in data])
+        # int32 holds any vocabulary id (BERT's is 30522) and masks are 0/1,
+        # so both are stored narrower than torch's default int64
+        input_ids = np.zeros((len(encoded), self.max_length), dtype=np.int32)
+        attention_mask = np.zeros((len(encoded), self.max_length), dtype=np.uint8)
+        if encoded:
+            # Rows are already padded to max_length, so numpy can copy the
+            # nested lists in one C-level pass
+            ids, masks = zip(*encoded)
+            input_ids[:] = ids
+            attention_mask[:] = masks
+        return input_ids, attention_mask
 
 def main():
     reader = UnifiedReader()
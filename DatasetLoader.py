@@ -1,26 +1,199 @@
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
+import json
+import os
+from pathlib import Path
+import uuid
+import numpy as np
+import torch
 from torch.utils.data import Dataset, DataLoader
 from Data_Pipeline.dataReader import UnifiedReader, LLMDataPreparer
 
 class LargeDataset(Dataset):
-    def __init__(self, data_dir, model_name, max_length=512):
+    """
+    Tokenized corpus from data_dir, optionally backed by memory-mapped files.
+
+    When a valid memmap cache is reused, neither data_dir nor the tokenizer
+    is loaded: self.data and self.preparer stay None until prepare_to_disk
+    is called.
+    """
+    # Samples keep these compact dtypes; cast with .long() at embedding time
+    DTYPES = {'input_ids': 'int32', 'attention_mask': 'uint8'}
+
+    def __init__(self, data_dir, model_name, max_length=512, memmap_dir=None, chunk_size=10000,
+                 chunk_cache_size=0, cache_dir=None):
         self.reader = UnifiedReader()
-        self.preparer = LLMDataPreparer(model_name, max_length)
-        self.data = self.reader.read_directory(data_dir)
+        self.data_dir = data_dir
+        self.model_name = model_name
+        self.max_length = max_length
+        self.chunk_size = chunk_size
+        self.chunk_cache_size = chunk_cache_size
+        self.cache_dir = cache_dir
+        self.data = None
+        self.preparer = None
+
+        if memmap_dir is None:
+            # Tokenize everything once up front into (N, max_length) tensors;
+            # shared memory keeps DataLoader workers from copying them
+            self._load_corpus()
+            input_ids, attention_mask = self.preparer.prepare_arrays(self.data)
+            self.input_ids = torch.from_numpy(input_ids).share_memory_()
+            self.attention_mask = torch.from_numpy(attention_mask).share_memory_()
+        else:
+            # Tokens live in memory-mapped files that all workers share through
+            # the page cache; they are only rebuilt when missing or stale
+            meta = self._read_meta(memmap_dir)
+            if meta is None:
+                meta = self.prepare_to_disk(memmap_dir)
+            try:
+                input_ids = self._open_memmap(memmap_dir, 'input_ids', meta)
+                attention_mask = self._open_memmap(memmap_dir, 'attention_mask', meta)
+            except FileNotFoundError:
+                # Another process replaced the cache between reading meta.json
+                # and opening its files; rebuild and use our own version
+                meta = self.prepare_to_disk(memmap_dir)
+                input_ids = self._open_memmap(memmap_dir, 'input_ids', meta)
+                attention_mask = self._open_memmap(memmap_dir, 'attention_mask', meta)
+            self.input_ids = torch.from_numpy(input_ids)
+            self.attention_mask = torch.from_numpy(attention_mask)
+
+    def _load_corpus(self):
+        # Loading the tokenizer and scanning data_dir are both IO-bound,
+        # so the tokenizer loads in the background while files are read
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            preparer = None
+            if self.preparer is None:
+                preparer = executor.submit(LLMDataPreparer, self.model_name, self.max_length,
+                                           cache_dir=self.cache_dir, chunk_cache_size=self.chunk_cache_size)
+            if self.data is None:
+                self.data = self.reader.read_directory(self.data_dir)
+            if preparer is not None:
+                self.preparer = preparer.result()
+
+    def _fingerprint(self):
+        # Paths, sizes and mtimes are enough to notice added, removed or
+        # edited files without reading their contents
+        digest = hashlib.blake2b(digest_size=16)
+        for path in sorted(self.reader.list_files(self.data_dir)):
+            stat = os.stat(path)
+            digest.update(os.fsencode(path) + f"|{stat.st_size}|{stat.st_mtime_ns}\0".encode('utf-8'))
+        return digest.hexdigest()
+
+    def _cache_identity(self):
+        return {
+            'data_dir': os.path.abspath(self.data_dir),
+            'fingerprint': self._fingerprint(),
+            'model_name': self.model_name,
+            'max_length': self.max_length,
+            'chunked': bool(self.chunk_cache_size),
+            'dtypes': self.DTYPES,
+        }
+
+    def _read_meta(self, memmap_dir):
+        meta_path = Path(memmap_dir) / 'meta.json'
+        try:
+            meta = json.loads(meta_path.read_text())
+        except FileNotFoundError:
+            return None
+        except (json.JSONDecodeError, UnicodeDecodeError):
+            # A damaged meta.json is treated as a miss and rewritten
+            return None
+        if not isinstance(meta, dict) or 'version' not in meta:
+            return None
+        if any(meta.get(key) != value for key, value in self._cache_identity().items()):
+            return None
+        return meta
+
+    def _open_memmap(self, memmap_dir, name, meta):
+        shape = (meta['num_samples'], meta['max_length'])
+        if meta['num_samples'] == 0:
+            return np.zeros(shape, dtype=meta['dtypes'][name])
+        # Copy-on-write keeps the mapping shared while giving torch a writable array
+        return np.memmap(Path(memmap_dir) / f"{name}.{meta['version']}.bin", dtype=meta['dtypes'][name], mode='c', shape=shape)
+
+    def prepare_to_disk(self, memmap_dir):
+        """
+        Tokenizes self.data in chunks into memory-mapped files under memmap_dir.
+
+        Every rebuild writes a new version of the files and publishes it by
+        atomically replacing meta.json, so files other processes have mapped
+        are never truncated or rewritten underneath them.
+        """
+        memmap_dir = Path(memmap_dir)
+        memmap_dir.mkdir(parents=True, exist_ok=True)
+        # Fingerprint before (re)reading so files changed mid-read trigger a
+        # rebuild instead of saving stale tokens under the new fingerprint
+        meta = self._cache_identity()
+        self.data = None
+        self._load_corpus()
+        meta['num_samples'] = len(self.data)
+        meta['version'] = version = uuid.uuid4().hex
+        paths = {name: memmap_dir / f'{name}.{version}.bin' for name in self.DTYPES}
+
+        if self.data:
+            shape = (len(self.data), self.max_length)
+            input_ids = np.memmap(f"{paths['input_ids']}.tmp", dtype=self.DTYPES['input_ids'], mode='w+', shape=shape)
+            attention_mask = np.memmap(f"{paths['attention_mask']}.tmp", dtype=self.DTYPES['attention_mask'], mode='w+', shape=shape)
+            for start in range(0, len(self.data), self.chunk_size):
+                chunk_ids, chunk_mask = self.preparer.prepare_arrays(self.data[start:start + self.chunk_size])
+                input_ids[start:start + len(chunk_ids)] = chunk_ids
+                attention_mask[start:start + len(chunk_mask)] = chunk_mask
+            input_ids.flush()
+            attention_mask.flush()
+            del input_ids, attention_mask
+            for path in paths.values():
+                os.replace(f'{path}.tmp', path)
+
+        # Published last so an interrupted run is rebuilt rather than reused
+        meta_tmp = memmap_dir / f'meta.json.{version}.tmp'
+        meta_tmp.write_text(json.dumps(meta))
+        os.replace(meta_tmp, memmap_dir / 'meta.json')
+
+        # Older versions are only unlinked; existing mappings of them stay valid
+        for path in memmap_dir.glob('*.bin'):
+            if path not in paths.values():
+                path.unlink(missing_ok=True)
+        return meta
     
     def __len__(self):
-        return len(self.data)
+        return len(self.input_ids)
     
     def __getitem__(self, idx):
-        return self.preparer.prepare_data([self.data[idx]])[0]
+        return {
+            'input_ids': self.input_ids[idx],
+            'attention_mask': self.attention_mask[idx],
+        }
+
+def _cast_batch(input_ids, attention_mask):
+    return input_ids.long(), attention_mask.long()
+
+# Compilation is lazy and only used on CUDA, where CUDA graphs remove the
+# per-batch launch overhead; on CPU Inductor would need a C++ toolchain
+_compiled_cast_batch = torch.compile(_cast_batch, mode='reduce-overhead', dynamic=False)
+
+def to_model_inputs(batch, device):
+    """
+    Moves a collated batch to device and widens it to the dtypes models expect.
+
+    On CUDA the returned tensors are CUDA graph buffers that the next call
+    overwrites; clone them if they must outlive the current iteration (e.g.
+    for gradient accumulation or prefetching). Use drop_last=True so every
+    batch has the same shape and only one graph is recorded.
+    """
+    input_ids = batch['input_ids'].to(device, non_blocking=True)
+    attention_mask = batch['attention_mask'].to(device, non_blocking=True)
+    cast = _compiled_cast_batch if input_ids.device.type == 'cuda' else _cast_batch
+    input_ids, attention_mask = cast(input_ids, attention_mask)
+    return {'input_ids': input_ids, 'attention_mask': attention_mask}
 
 # In main function:
 data_dir = 'data'
+device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
 
 dataset = LargeDataset(data_dir, 'bert-base-uncased')
-dataloader = DataLoader(dataset, batch_size=32, shuffle=True)
+dataloader = DataLoader(dataset, batch_size=32, shuffle=True, drop_last=True, pin_memory=device.type == 'cuda')
 print(dataloader)
 
 # Now you can iterate over dataloader in your training loop
 for batch in dataloader:
-
-    pass
\ No newline at end of file
+    inputs = to_model_inputs(batch, device)